@@ -1,3 +1,4 @@
+import asyncio
 import os
 import sys
 import json
@@ -8,7 +9,8 @@ import numpy as np
 import pandas as pd
 
 from src.config import CONFIG, MODELS_DIR, CACHE_DIR, LOGS_DIR
-from src.features import fetch_prices, compute_indicators, align_and_merge_sentiment, make_last_window
+from src.features import compute_indicators, align_and_merge_sentiment, make_last_window
+from src.fetcher import build_provider, stream_prices
 from src.sentiment import read_news_csv, compute_daily_sentiment
 from src.model_loader import (
     load_scaler,
@@ -73,7 +75,93 @@ def prob_to_signal(prob_up: float) -> str:
     return "HOLD"
 
 
-def main():
+def process_ticker(ticker: str, px: pd.DataFrame, end_date: date, feature_cols, seq_len: int):
+    """Features, scaling, Transformer and PPO for one ticker's prices.
+    Returns (signals row, PPO diagnostics row)."""
+    # 1) Indicators
+    px = compute_indicators(px)
+
+    # 2) Sentiment
+    sent_daily = ensure_sentiment_cache(ticker)
+    feat_df = align_and_merge_sentiment(px, sent_daily)
+
+    # Verify feature availability
+    missing = [c for c in feature_cols if c not in feat_df.columns]
+    if missing:
+        raise ValueError(f"Missing required features for {ticker}: {missing}")
+
+    # 3) Scaling (must match training)
+    scaler, scaler_path = load_scaler(MODELS_DIR, ticker)
+    if scaler is None:
+        raise FileNotFoundError(
+            f"Scaler not found for {ticker}: {scaler_path}. Please copy scaler_{ticker}.pkl from your notebook's MODELS_DIR."
+        )
+    X_scaled = scaler.transform(feat_df[feature_cols].values)
+
+    # 4) Last window for Transformer
+    last_win = make_last_window(pd.DataFrame(X_scaled, index=feat_df.index, columns=feature_cols), feature_cols, seq_len)
+
+    # 5) Transformer prob_up
+    model, t_path = load_transformer(MODELS_DIR, ticker, n_features=len(feature_cols), seq_len=seq_len, device="cpu")
+    prob_up = transformer_prob_up(model, last_win, device="cpu")
+
+    # 6) Build PPO observation and decide action
+    obs_vec = np.concatenate([last_win.flatten(), np.array([prob_up], dtype=np.float32)])
+    ppo, ppo_path = load_ppo(MODELS_DIR, ticker)
+    # Deterministic action for production signal
+    action, _ = ppo_decide_action(ppo, obs_vec)
+    ppo_signal = map_action_to_signal(action)
+
+    # Threshold-based signal (used as primary Signal)
+    signal = prob_to_signal(prob_up)
+
+    # 6b) Price info (use latest row from features)
+    try:
+        latest_close = float(feat_df["Close"].iloc[-1])
+    except Exception:
+        latest_close = None
+    try:
+        # Return is fraction; convert to percent
+        change_pct = float(feat_df["Return"].iloc[-1] * 100.0)
+    except Exception:
+        change_pct = None
+    try:
+        latest_volume = float(feat_df["Volume"].iloc[-1])
+    except Exception:
+        latest_volume = None
+    try:
+        vol_norm = float(feat_df.get("Vol_norm", pd.Series([np.nan])).iloc[-1])
+    except Exception:
+        vol_norm = None
+
+    result = {
+        "Date": end_date.isoformat(),
+        "Ticker": ticker,
+        "ProbUp": round(float(prob_up), 6),
+        # Keep original action for compatibility
+        "Action": int(action),
+        # Primary display signal mapped by probability thresholds
+        "Signal": signal,
+        "Price": round(latest_close, 2) if latest_close is not None else "",
+        "ChangePct": round(change_pct, 2) if change_pct is not None else "",
+        "Volume": int(latest_volume) if latest_volume is not None and not np.isnan(latest_volume) else "",
+        "Vol_norm": round(vol_norm, 3) if vol_norm is not None and not np.isnan(vol_norm) else "",
+    }
+    # collect PPO diagnostics (written to logs/ppo_<date>.csv later)
+    ppo_row = {
+        "Date": end_date.isoformat(),
+        "Ticker": ticker,
+        "PPO_Action": int(action),
+        "PPO_Signal": ppo_signal,
+        "ProbUp": round(float(prob_up), 6),
+    }
+    # console log without PPO details
+    log(f"{ticker}: ProbUp={prob_up:.3f} -> Signal={signal}")
+    return result, ppo_row
+
+
+async def main_async():
+    """Run the daily pipeline. Awaitable from notebooks or other async code."""
     tickers = CONFIG["tickers"]
     seq_len = CONFIG["seq_len"]
     feature_cols = CONFIG["features"]
@@ -87,94 +175,33 @@ def main():
     results = []
     ppo_rows = []  # collect PPO diagnostics for separate file
 
-    for ticker in tickers:
-        try:
-            log(f"Processing {ticker}...")
-            # 1) Data and indicators
-            px = fetch_prices(ticker, start=start_date.isoformat(), end=end_date.isoformat())
-            px = compute_indicators(px)
-
-            # 2) Sentiment
-            sent_daily = ensure_sentiment_cache(ticker)
-            feat_df = align_and_merge_sentiment(px, sent_daily)
-
-            # Verify feature availability
-            missing = [c for c in feature_cols if c not in feat_df.columns]
-            if missing:
-                raise ValueError(f"Missing required features for {ticker}: {missing}")
-
-            # 3) Scaling (must match training)
-            scaler, scaler_path = load_scaler(MODELS_DIR, ticker)
-            if scaler is None:
-                raise FileNotFoundError(
-                    f"Scaler not found for {ticker}: {scaler_path}. Please copy scaler_{ticker}.pkl from your notebook's MODELS_DIR."
-                )
-            X_scaled = scaler.transform(feat_df[feature_cols].values)
-
-            # 4) Last window for Transformer
-            last_win = make_last_window(pd.DataFrame(X_scaled, index=feat_df.index, columns=feature_cols), feature_cols, seq_len)
-
-            # 5) Transformer prob_up
-            model, t_path = load_transformer(MODELS_DIR, ticker, n_features=len(feature_cols), seq_len=seq_len, device="cpu")
-            prob_up = transformer_prob_up(model, last_win, device="cpu")
-
-            # 6) Build PPO observation and decide action
-            obs_vec = np.concatenate([last_win.flatten(), np.array([prob_up], dtype=np.float32)])
-            ppo, ppo_path = load_ppo(MODELS_DIR, ticker)
-            # Deterministic action for production signal
-            action, _ = ppo_decide_action(ppo, obs_vec)
-            ppo_signal = map_action_to_signal(action)
-
-            # Threshold-based signal (used as primary Signal)
-            signal = prob_to_signal(prob_up)
-
-            # 6b) Price info (use latest row from features)
-            try:
-                latest_close = float(feat_df["Close"].iloc[-1])
-            except Exception:
-                latest_close = None
-            try:
-                # Return is fraction; convert to percent
-                change_pct = float(feat_df["Return"].iloc[-1] * 100.0)
-            except Exception:
-                change_pct = None
-            try:
-                latest_volume = float(feat_df["Volume"].iloc[-1])
-            except Exception:
-                latest_volume = None
+    # Downloads overlap with feature/model work for tickers that already arrived
+    provider = build_provider(CONFIG["fetch"])
+    try:
+        log(f"Fetching prices for {len(tickers)} tickers via {provider.name}...")
+        async for ticker, px, err in stream_prices(
+            tickers, start_date.isoformat(), end_date.isoformat(), provider, CONFIG["fetch"], log=log
+        ):
             try:
-                vol_norm = float(feat_df.get("Vol_norm", pd.Series([np.nan])).iloc[-1])
-            except Exception:
-                vol_norm = None
-
-            results.append({
-                "Date": end_date.isoformat(),
-                "Ticker": ticker,
-                "ProbUp": round(float(prob_up), 6),
-                # Keep original action for compatibility
-                "Action": int(action),
-                # Primary display signal mapped by probability thresholds
-                "Signal": signal,
-                "Price": round(latest_close, 2) if latest_close is not None else "",
-                "ChangePct": round(change_pct, 2) if change_pct is not None else "",
-                "Volume": int(latest_volume) if latest_volume is not None and not np.isnan(latest_volume) else "",
-                "Vol_norm": round(vol_norm, 3) if vol_norm is not None and not np.isnan(vol_norm) else "",
-            })
-            # collect PPO diagnostics (written to logs/ppo_<date>.csv later)
-            ppo_rows.append({
-                "Date": end_date.isoformat(),
-                "Ticker": ticker,
-                "PPO_Action": int(action),
-                "PPO_Signal": ppo_signal,
-                "ProbUp": round(float(prob_up), 6),
-            })
-            # console log without PPO details
-            log(f"{ticker}: ProbUp={prob_up:.3f} -> Signal={signal}")
-
-            # No testing debug collection in normal mode
-        except Exception as e:
-            log(f"[ERROR] {ticker}: {e}")
-            traceback.print_exc()
+                if err is not None:
+                    raise err
+                log(f"Processing {ticker}...")
+                # Off the event loop so pending downloads and retries keep running
+                result, ppo_row = await asyncio.to_thread(
+                    process_ticker, ticker, px, end_date, feature_cols, seq_len
+                )
+                results.append(result)
+                ppo_rows.append(ppo_row)
+            except Exception as e:
+                log(f"[ERROR] {ticker}: {e}")
+                traceback.print_exc()
+    finally:
+        provider.close()
+
+    # Tickers finish in arbitrary order; keep the configured order in outputs
+    order = {t: i for i, t in enumerate(tickers)}
+    results.sort(key=lambda r: order[r["Ticker"]])
+    ppo_rows.sort(key=lambda r: order[r["Ticker"]])
 
     # 7) Write/append to a single cumulative CSV
     if results:
@@ -216,5 +243,11 @@ def main():
         log(f"[WARN] Failed writing PPO diagnostics: {e}")
 
 
+def main():
+    """Blocking entry point. Inside a running event loop (e.g. Jupyter), use
+    `await main_async()` instead."""
+    asyncio.run(main_async())
+
+
 if __name__ == "__main__":
     main()
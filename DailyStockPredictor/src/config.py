@@ -38,4 +38,16 @@ CONFIG = {
     "news_csv": os.path.join(DATA_DIR, "Combined_News_DJIA.csv"),
     # Transaction fee assumption if needed for any strategy reporting
     "fee_bps": 5,
+    # Price download settings (see src/fetcher.py)
+    "fetch": {
+        # "yfinance" for live data, or "http_stub" to read CSVs from a local stub server
+        "provider": "yfinance",
+        "stub_url": None,  # e.g. "http://127.0.0.1:8765" when provider is "http_stub"
+        "max_concurrency": 4,  # downloads in flight at once
+        "rate_per_sec": 2.0,  # token-bucket refill rate; <= 0 disables throttling
+        "burst": 4,  # token-bucket capacity
+        "max_retries": 3,
+        "backoff_base": 1.0,  # seconds; doubles per retry with jitter
+        "backoff_max": 30.0,
+    },
 }
@@ -1,74 +1,15 @@
 import numpy as np
 import pandas as pd
-import yfinance as yf
 
 from typing import List, Tuple
 
+from src.fetcher import YFinanceProvider
 
-def fetch_prices(ticker: str, start: str, end: str) -> pd.DataFrame:
-    """Fetch OHLCV for a single ticker, robust to different yfinance shapes."""
-    df = yf.download(ticker, start=start, end=end, auto_adjust=True, progress=False, group_by="column")
-    if df is None or df.empty:
-        raise ValueError(f"No price data returned for {ticker}")
 
-    # Debug incoming columns
-    try:
-        print(f"[features.fetch_prices] {ticker} raw cols:", df.columns)
-    except Exception:
-        pass
-
-    # Case 1: MultiIndex with (Price, Ticker) or (Ticker, Price)
-    if isinstance(df.columns, pd.MultiIndex):
-        level_names = list(df.columns.names)
-        # Try to find the level that holds the ticker symbol
-        ticker_level_idx = None
-        for i, name in enumerate(level_names):
-            try:
-                vals = [str(v).upper() for v in df.columns.get_level_values(i)]
-                if ticker.upper() in vals:
-                    ticker_level_idx = i
-                    break
-            except Exception:
-                continue
-        if ticker_level_idx is not None:
-            # Find the exact label object that matches the ticker (case-insensitive)
-            label = None
-            for val in df.columns.levels[ticker_level_idx]:
-                if str(val).upper() == ticker.upper():
-                    label = val
-                    break
-            if label is not None:
-                sub = df.xs(label, level=ticker_level_idx, axis=1)
-                # After xs, columns should be price fields
-                sub.columns = [str(c).strip().title() for c in sub.columns]
-                if set(["Open","High","Low","Close","Volume"]).issubset(sub.columns):
-                    out = sub[["Open","High","Low","Close","Volume"]].dropna().copy()
-                    out.index.name = "Date"
-                    return out
-
-    # Case 3: Single column with ticker name (e.g., ['AAPL']) -> use Ticker().history
-    if len(df.columns) == 1 and str(df.columns[0]).strip().upper() == ticker.upper():
-        try:
-            th = yf.Ticker(ticker).history(start=start, end=end, auto_adjust=True)
-            if th is not None and not th.empty:
-                th = th.rename(columns=str.title)
-                if set(["Open","High","Low","Close","Volume"]).issubset(th.columns):
-                    out = th[["Open","High","Low","Close","Volume"]].dropna().copy()
-                    out.index.name = "Date"
-                    return out
-        except Exception:
-            pass
-
-    # Case 4: Already flat single-ticker columns, normalize titles last
-    norm = df.copy()
-    norm.columns = [str(c).strip().title() for c in norm.columns]
-    if set(["Open","High","Low","Close","Volume"]).issubset(norm.columns):
-        out = norm[["Open","High","Low","Close","Volume"]].dropna().copy()
-        out.index.name = "Date"
-        return out
-
-    # If we got here, raise an informative error
-    raise ValueError(f"Unable to extract OHLCV for {ticker}. Got columns: {list(df.columns)}")
+def fetch_prices(ticker: str, start: str, end: str) -> pd.DataFrame:
+    """Fetch OHLCV for a single ticker (blocking). Uses the same Yahoo path as
+    the async layer in src/fetcher.py; prefer `stream_prices` for many tickers."""
+    return YFinanceProvider().fetch(ticker, start, end)
 
 
 def compute_indicators(df: pd.DataFrame) -> pd.DataFrame:
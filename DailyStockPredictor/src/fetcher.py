@@ -0,0 +1,367 @@
+import asyncio
+import http.client
+import io
+import os
+import queue
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import AsyncIterator, Callable, Iterable, Optional, Tuple
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+import pandas as pd
+
+try:
+    import yfinance as yf
+    from yfinance import exceptions as _yf_exc
+    _HAS_YF = True
+    # Yahoo has no data for the ticker/range; anything else (network, rate limit) is transient
+    _YF_NO_DATA = tuple(
+        getattr(_yf_exc, n) for n in ("YFPricesMissingError", "YFTzMissingError") if hasattr(_yf_exc, n)
+    )
+    # yfinance >= 1.0 moved raise_errors to the global yf.config.debug.hide_exceptions
+    _YF_HAS_DEBUG_CONFIG = hasattr(yf, "config") and "hide_exceptions" in getattr(yf.config.debug, "data", {})
+except Exception:
+    _HAS_YF = False
+    _YF_NO_DATA = ()
+    _YF_HAS_DEBUG_CONFIG = False
+
+_yf_errors_lock = threading.Lock()
+_yf_errors_depth = 0
+_yf_hide_saved = None
+
+
+OHLCV = ["Open", "High", "Low", "Close", "Volume"]
+
+
+def _normalize_ohlcv(df: pd.DataFrame, ticker: str) -> pd.DataFrame:
+    """Return a flat, tz-naive OHLCV frame indexed by Date."""
+    if df is None or df.empty:
+        raise ValueError(f"No price data returned for {ticker}")
+    out = df.copy()
+    if isinstance(out.columns, pd.MultiIndex):
+        out.columns = out.columns.get_level_values(0)
+    out.columns = [str(c).strip().title() for c in out.columns]
+    if not set(OHLCV).issubset(out.columns):
+        raise ValueError(f"Unable to extract OHLCV for {ticker}. Got columns: {list(out.columns)}")
+    out = out[OHLCV].dropna().copy()
+    out.index = pd.to_datetime(out.index)
+    if out.index.tz is not None:
+        out.index = out.index.tz_localize(None)
+    out.index.name = "Date"
+    return out
+
+
+class PriceProvider:
+    """Blocking OHLCV source. The async layer runs `fetch` on worker threads."""
+
+    name = "base"
+
+    def fetch(self, ticker: str, start: str, end: str) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class YFinanceProvider(PriceProvider):
+    """Yahoo Finance via `Ticker.history`, which always returns flat columns,
+    so a single request per ticker is enough (no `download` + fallback)."""
+
+    name = "yfinance"
+
+    def __init__(self, session=None):
+        if not _HAS_YF:
+            raise ImportError("yfinance is required for the 'yfinance' provider")
+        # yfinance reuses its shared session when none is given
+        self.session = session
+
+    def fetch(self, ticker: str, start: str, end: str) -> pd.DataFrame:
+        kwargs = {"session": self.session} if self.session is not None else {}
+        history_kwargs = {} if _YF_HAS_DEBUG_CONFIG else {"raise_errors": True}
+        try:
+            with _yf_raise_errors():
+                df = yf.Ticker(ticker, **kwargs).history(
+                    start=start, end=end, auto_adjust=True, **history_kwargs
+                )
+        except _YF_NO_DATA as e:
+            raise ValueError(f"No price data returned for {ticker}: {e}") from e
+        return _normalize_ohlcv(df, ticker)
+
+
+@contextmanager
+def _yf_raise_errors():
+    """Make yfinance raise network/HTTP errors instead of logging them and
+    returning an empty frame, so they reach the retry loop.
+
+    The switch is process-wide, so it is reference-counted across worker
+    threads and restored once the last fetch finishes.
+    """
+    global _yf_errors_depth, _yf_hide_saved
+    if not _YF_HAS_DEBUG_CONFIG:
+        yield
+        return
+    with _yf_errors_lock:
+        if _yf_errors_depth == 0:
+            _yf_hide_saved = yf.config.debug.hide_exceptions
+            yf.config.debug.hide_exceptions = False
+        _yf_errors_depth += 1
+    try:
+        yield
+    finally:
+        with _yf_errors_lock:
+            _yf_errors_depth -= 1
+            if _yf_errors_depth == 0:
+                yf.config.debug.hide_exceptions = _yf_hide_saved
+
+
+class HttpStubProvider(PriceProvider):
+    """Reads CSV prices from `GET {base_url}/prices/{ticker}?start=..&end=..`.
+
+    Keeps a small pool of keep-alive connections so repeated requests reuse
+    the same sockets. Pair with `serve_stub_prices` for offline runs.
+    """
+
+    name = "http_stub"
+
+    def __init__(self, base_url: str, pool_size: int = 4, timeout: float = 10.0):
+        parts = urlsplit(base_url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"Invalid stub base URL: {base_url}")
+        self._https = parts.scheme == "https"
+        self._host = parts.hostname
+        self._port = parts.port
+        self._prefix = parts.path.rstrip("/")
+        self._timeout = timeout
+        self._pool: "queue.LifoQueue[http.client.HTTPConnection]" = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self) -> Tuple[http.client.HTTPConnection, bool]:
+        """Return (connection, reused) — pooled if one is idle, else a fresh one."""
+        try:
+            return self._pool.get_nowait(), True
+        except queue.Empty:
+            return self._new_connection(), False
+
+    def _new_connection(self) -> http.client.HTTPConnection:
+        cls = http.client.HTTPSConnection if self._https else http.client.HTTPConnection
+        return cls(self._host, self._port, timeout=self._timeout)
+
+    def _release(self, conn: http.client.HTTPConnection) -> None:
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def fetch(self, ticker: str, start: str, end: str) -> pd.DataFrame:
+        path = f"{self._prefix}/prices/{quote(ticker)}?start={quote(start)}&end={quote(end)}"
+        conn, reused = self._connect()
+        while True:
+            try:
+                conn.request("GET", path, headers={"Connection": "keep-alive"})
+                resp = conn.getresponse()
+                body = resp.read()
+                break
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                conn.close()
+                if not reused:
+                    raise
+                # The server closed an idle pooled socket; retry once on a fresh one
+                conn, reused = self._new_connection(), False
+            except Exception:
+                conn.close()
+                raise
+        if resp.will_close:
+            conn.close()
+        else:
+            self._release(conn)
+
+        if resp.status == 404:
+            raise ValueError(f"No price data returned for {ticker}")
+        if 400 <= resp.status < 500 and resp.status != 429:
+            # Bad request; retrying won't help
+            raise ValueError(f"Stub rejected request for {ticker}: HTTP {resp.status} {body.decode('utf-8', 'replace')}")
+        if resp.status != 200:
+            # 429/5xx and friends are worth retrying
+            raise ConnectionError(f"Stub returned HTTP {resp.status} for {ticker}")
+        df = pd.read_csv(io.BytesIO(body), index_col="Date", parse_dates=["Date"])
+        return _normalize_ohlcv(df, ticker)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def build_provider(cfg: dict) -> PriceProvider:
+    """Create the provider named in CONFIG["fetch"]."""
+    name = cfg.get("provider", "yfinance")
+    if name == "yfinance":
+        return YFinanceProvider()
+    if name == "http_stub":
+        url = cfg.get("stub_url")
+        if not url:
+            raise ValueError("CONFIG['fetch']['stub_url'] is required for the 'http_stub' provider")
+        return HttpStubProvider(url, pool_size=int(cfg.get("max_concurrency", 4)))
+    raise ValueError(f"Unknown price provider: {name}")
+
+
+class TokenBucket:
+    """Async token bucket: `rate` requests/sec on average, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self._tokens = self.capacity
+        self._last: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            while True:
+                now = loop.time()
+                if self._last is not None:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    # ValueError/KeyError mean the data itself is unusable; retrying won't help
+    return not isinstance(exc, (ValueError, KeyError))
+
+
+async def _fetch_one(
+    provider: PriceProvider,
+    ticker: str,
+    start: str,
+    end: str,
+    sem: asyncio.Semaphore,
+    bucket: TokenBucket,
+    executor: ThreadPoolExecutor,
+    max_retries: int,
+    backoff_base: float,
+    backoff_max: float,
+    log: Callable[[str], None],
+) -> pd.DataFrame:
+    attempt = 0
+    while True:
+        async with sem:
+            await bucket.acquire()
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(executor, provider.fetch, ticker, start, end)
+            except Exception as e:
+                if attempt >= max_retries or not _is_retryable(e):
+                    raise
+                err = e
+        # Back off outside the semaphore so other tickers keep the slot busy
+        delay = min(backoff_max, backoff_base * (2 ** attempt))
+        delay *= 0.5 + random.random() / 2
+        log(f"[fetcher] {ticker} attempt {attempt + 1} failed ({err}); retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def stream_prices(
+    tickers: Iterable[str],
+    start: str,
+    end: str,
+    provider: PriceProvider,
+    cfg: Optional[dict] = None,
+    log: Callable[[str], None] = print,
+) -> AsyncIterator[Tuple[str, Optional[pd.DataFrame], Optional[BaseException]]]:
+    """Fetch all tickers concurrently and yield (ticker, prices, error) as each finishes.
+
+    Downloads run on a dedicated thread pool sized to `max_concurrency`, so
+    they never compete with the default executor and the caller can compute features for
+    a yielded ticker while the remaining requests are still in flight, as long
+    as that work runs off the event loop (e.g. via `asyncio.to_thread`).
+    Retry notices are passed to `log`.
+    """
+    cfg = cfg or {}
+    max_concurrency = max(1, int(cfg.get("max_concurrency", 4)))
+    sem = asyncio.Semaphore(max_concurrency)
+    executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="fetcher")
+    bucket = TokenBucket(cfg.get("rate_per_sec", 2.0), cfg.get("burst", 4))
+    max_retries = int(cfg.get("max_retries", 3))
+    backoff_base = float(cfg.get("backoff_base", 1.0))
+    backoff_max = float(cfg.get("backoff_max", 30.0))
+
+    async def run(ticker: str):
+        try:
+            df = await _fetch_one(provider, ticker, start, end, sem, bucket, executor,
+                                  max_retries, backoff_base, backoff_max, log)
+            return ticker, df, None
+        except Exception as e:
+            return ticker, None, e
+
+    tasks = [asyncio.ensure_future(run(t)) for t in tickers]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            yield await fut
+    finally:
+        for t in tasks:
+            t.cancel()
+        # Don't block on downloads already running; they finish in the background
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def serve_stub_prices(data_dir: str, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Serve `{data_dir}/{TICKER}.csv` files for `HttpStubProvider` on a background thread.
+
+    CSVs need a Date column plus OHLCV. Use `port=0` to pick a free port and
+    read it back from `server.server_address`; call `server.shutdown()` when done.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            segs = [s for s in parts.path.split("/") if s]
+            if len(segs) != 2 or segs[0] != "prices":
+                return self._send(404, b"not found")
+            ticker = os.path.basename(unquote(segs[1])).upper()
+            path = os.path.join(data_dir, f"{ticker}.csv")
+            if not os.path.exists(path):
+                return self._send(404, b"unknown ticker")
+            q = parse_qs(parts.query)
+            try:
+                start = pd.to_datetime(q["start"][0]) if "start" in q else None
+                end = pd.to_datetime(q["end"][0]) if "end" in q else None
+            except (ValueError, TypeError) as e:
+                return self._send(400, f"bad date: {e}".encode("utf-8"))
+            df = pd.read_csv(path, index_col="Date", parse_dates=["Date"])
+            if start is not None:
+                df = df[df.index >= start]
+            if end is not None:
+                # Match yfinance: end date is exclusive
+                df = df[df.index < end]
+            if df.empty:
+                return self._send(404, b"no rows in range")
+            self._send(200, df.to_csv().encode("utf-8"), "text/csv")
+
+        def _send(self, status: int, body: bytes, ctype: str = "text/plain"):
+            self.send_response(status)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Make `src` and `daily_predict` importable when running pytest from anywhere
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
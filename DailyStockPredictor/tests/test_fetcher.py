@@ -0,0 +1,285 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import fetcher
+from src.fetcher import HttpStubProvider, PriceProvider, TokenBucket, YFinanceProvider, serve_stub_prices, stream_prices
+
+
+def _frame(start="2024-01-01", end="2024-03-29") -> pd.DataFrame:
+    idx = pd.bdate_range(start, end, name="Date")
+    close = np.linspace(100.0, 110.0, len(idx))
+    return pd.DataFrame(
+        {"Open": close, "High": close + 1, "Low": close - 1, "Close": close, "Volume": 1000},
+        index=idx,
+    )
+
+
+def _collect(tickers, provider, cfg=None, log=None):
+    async def run():
+        out = []
+        kwargs = {"log": log} if log is not None else {}
+        async for item in stream_prices(tickers, "2024-02-01", "2024-03-01", provider, cfg or {}, **kwargs):
+            out.append(item)
+        return out
+    return asyncio.run(run())
+
+
+class FakeProvider(PriceProvider):
+    """In-memory provider that can delay, fail a few times, and track concurrency."""
+
+    def __init__(self, delay=0.0, failures=None, error=ConnectionError):
+        self.delay = delay
+        self.failures = dict(failures or {})
+        self.error = error
+        self.calls = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.started = []
+        self._lock = threading.Lock()
+
+    def fetch(self, ticker, start, end):
+        with self._lock:
+            self.calls[ticker] = self.calls.get(ticker, 0) + 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.started.append(time.monotonic())
+            fail = self.failures.get(ticker, 0) > 0
+            if fail:
+                self.failures[ticker] -= 1
+        try:
+            time.sleep(self.delay(ticker) if callable(self.delay) else self.delay)
+            if fail:
+                raise self.error(f"boom {ticker}")
+            return _frame()
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+@pytest.fixture
+def stub_server(tmp_path):
+    for ticker in ["AAPL", "^GSPC"]:
+        _frame().to_csv(tmp_path / f"{ticker}.csv")
+    server = serve_stub_prices(str(tmp_path), port=0)
+    host, port = server.server_address[:2]
+    yield f"http://{host}:{port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_stub_round_trip_filters_dates_and_reuses_connection(stub_server):
+    provider = HttpStubProvider(stub_server, pool_size=1)
+    try:
+        df = provider.fetch("AAPL", "2024-02-01", "2024-03-01")
+        assert list(df.columns) == ["Open", "High", "Low", "Close", "Volume"]
+        assert df.index.name == "Date"
+        assert df.index.min() == pd.Timestamp("2024-02-01")
+        # end is exclusive, like yfinance
+        assert df.index.max() == pd.Timestamp("2024-02-29")
+        conn = provider._pool.queue[0]
+        provider.fetch("AAPL", "2024-02-01", "2024-03-01")
+        assert provider._pool.queue[0] is conn
+    finally:
+        provider.close()
+
+
+def test_stub_decodes_quoted_tickers(stub_server):
+    provider = HttpStubProvider(stub_server)
+    try:
+        assert not provider.fetch("^GSPC", "2024-02-01", "2024-03-01").empty
+    finally:
+        provider.close()
+
+
+def test_stub_client_errors_are_not_retried(stub_server):
+    provider = HttpStubProvider(stub_server)
+    messages = []
+    try:
+        with pytest.raises(ValueError, match="HTTP 400"):
+            provider.fetch("AAPL", "garbage", "x")
+        [(ticker, df, err)] = _collect(["MISSING"], provider, {"max_retries": 3}, log=messages.append)
+    finally:
+        provider.close()
+    assert ticker == "MISSING" and df is None
+    assert isinstance(err, ValueError)
+    assert messages == []
+
+
+def test_stale_pooled_connection_is_replaced(tmp_path):
+    body = _frame().to_csv().encode("utf-8")
+
+    class ClosingHandler(BaseHTTPRequestHandler):
+        # Advertises keep-alive but drops the socket after every response
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            self.close_connection = True
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ClosingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    provider = HttpStubProvider(f"http://127.0.0.1:{server.server_address[1]}")
+    try:
+        provider.fetch("AAPL", "2024-02-01", "2024-03-01")
+        time.sleep(0.05)
+        assert not provider.fetch("AAPL", "2024-02-01", "2024-03-01").empty
+    finally:
+        provider.close()
+        server.shutdown()
+        server.server_close()
+
+
+def test_semaphore_bounds_concurrency():
+    provider = FakeProvider(delay=0.05)
+    tickers = [f"T{i}" for i in range(6)]
+    out = _collect(tickers, provider, {"max_concurrency": 2, "rate_per_sec": 0})
+    assert sorted(t for t, _, _ in out) == sorted(tickers)
+    assert provider.max_in_flight == 2
+
+
+def test_token_bucket_paces_requests():
+    provider = FakeProvider()
+    t0 = time.monotonic()
+    _collect([f"T{i}" for i in range(5)], provider, {"max_concurrency": 5, "rate_per_sec": 20, "burst": 1})
+    # First request uses the initial token, the other four wait 1/20s each
+    assert time.monotonic() - t0 >= 0.19
+
+    async def burst():
+        bucket = TokenBucket(rate=1, capacity=3)
+        start = asyncio.get_running_loop().time()
+        for _ in range(3):
+            await bucket.acquire()
+        return asyncio.get_running_loop().time() - start
+    assert asyncio.run(burst()) < 0.1
+
+
+def test_transient_errors_retry_with_backoff():
+    provider = FakeProvider(failures={"AAPL": 2})
+    messages = []
+    cfg = {"max_retries": 3, "backoff_base": 0.05, "rate_per_sec": 0}
+    [(ticker, df, err)] = _collect(["AAPL"], provider, cfg, log=messages.append)
+    assert err is None and not df.empty
+    assert provider.calls["AAPL"] == 3
+    assert len(messages) == 2 and all(m.startswith("[fetcher] AAPL attempt") for m in messages)
+    # Second retry waits at least half of backoff_base * 2
+    assert provider.started[2] - provider.started[1] >= 0.05
+
+
+def test_retries_give_up_after_max_retries():
+    provider = FakeProvider(failures={"AAPL": 10})
+    cfg = {"max_retries": 2, "backoff_base": 0.01, "rate_per_sec": 0}
+    [(_, df, err)] = _collect(["AAPL"], provider, cfg, log=lambda m: None)
+    assert df is None and isinstance(err, ConnectionError)
+    assert provider.calls["AAPL"] == 3
+
+
+def test_value_errors_are_not_retried():
+    provider = FakeProvider(failures={"AAPL": 1}, error=ValueError)
+    [(_, df, err)] = _collect(["AAPL"], provider, {"max_retries": 3}, log=lambda m: None)
+    assert isinstance(err, ValueError)
+    assert provider.calls["AAPL"] == 1
+
+
+def _fake_yf_ticker(monkeypatch, errors):
+    """Patch yf.Ticker so `history` raises each of `errors` in turn, then returns data.
+    Records whether yfinance would have hidden exceptions at call time."""
+    yf = pytest.importorskip("yfinance")
+    errors = list(errors)
+    seen = []
+
+    class FakeTicker:
+        def __init__(self, ticker, session=None):
+            self.ticker = ticker
+
+        def history(self, **kwargs):
+            seen.append(yf.config.debug.hide_exceptions if fetcher._YF_HAS_DEBUG_CONFIG
+                        else kwargs.get("raise_errors") is not True)
+            if errors:
+                raise errors.pop(0)
+            df = _frame().tz_localize("America/New_York")
+            df["Dividends"] = 0.0
+            return df
+
+    monkeypatch.setattr(fetcher.yf, "Ticker", FakeTicker)
+    return yf, seen
+
+
+def test_yfinance_transient_errors_are_retried(monkeypatch):
+    exc = pytest.importorskip("yfinance.exceptions")
+    yf, seen = _fake_yf_ticker(monkeypatch, [ConnectionError("dns"), exc.YFRateLimitError()])
+    cfg = {"max_retries": 3, "backoff_base": 0.01, "rate_per_sec": 0}
+    [(_, df, err)] = _collect(["AAPL"], YFinanceProvider(), cfg, log=lambda m: None)
+    assert err is None
+    assert list(df.columns) == ["Open", "High", "Low", "Close", "Volume"]
+    assert df.index.tz is None
+    assert seen == [False, False, False]
+    if fetcher._YF_HAS_DEBUG_CONFIG:
+        assert yf.config.debug.hide_exceptions is True
+
+
+def test_yfinance_missing_data_is_not_retried(monkeypatch):
+    exc = pytest.importorskip("yfinance.exceptions")
+    yf, seen = _fake_yf_ticker(monkeypatch, [exc.YFPricesMissingError("AAPL", ""), ConnectionError("unreached")])
+    [(_, df, err)] = _collect(["AAPL"], YFinanceProvider(), {"max_retries": 3}, log=lambda m: None)
+    assert isinstance(err, ValueError) and isinstance(err.__cause__, exc.YFPricesMissingError)
+    assert len(seen) == 1
+
+
+def test_daily_predict_overlaps_fetches_and_keeps_ticker_order(tmp_path, monkeypatch):
+    daily_predict = pytest.importorskip("daily_predict")
+    tickers = ["AAA", "BBB", "CCC", "DDD", "EEE", "FFF"]
+    # The first configured ticker arrives last
+    provider = FakeProvider(delay=lambda t: 0.3 if t == "AAA" else 0.1)
+    processing = []
+
+    def fake_process(ticker, px, end_date, feature_cols, seq_len):
+        start = time.monotonic()
+        time.sleep(0.3)
+        processing.append((start, time.monotonic()))
+        row = {"Date": end_date.isoformat(), "Ticker": ticker}
+        return dict(row, ProbUp=0.5, Signal="HOLD"), dict(row, PPO_Action=0, PPO_Signal="HOLD", ProbUp=0.5)
+
+    cfg = dict(daily_predict.CONFIG, tickers=tickers,
+               fetch={"max_concurrency": 2, "rate_per_sec": 0})
+    monkeypatch.setattr(daily_predict, "CONFIG", cfg)
+    monkeypatch.setattr(daily_predict, "LOGS_DIR", str(tmp_path))
+    monkeypatch.setattr(daily_predict, "build_provider", lambda c: provider)
+    monkeypatch.setattr(daily_predict, "process_ticker", fake_process)
+
+    daily_predict.main()
+
+    signals = pd.read_csv(tmp_path / "signals.csv")
+    assert list(signals["Ticker"]) == tickers
+    ppo_files = list(tmp_path.glob("ppo_*.csv"))
+    assert len(ppo_files) == 1
+    assert list(pd.read_csv(ppo_files[0])["Ticker"]) == tickers
+    # New downloads start while a ticker is being processed, i.e. the loop isn't blocked
+    assert any(ps + 0.05 < fs < pe - 0.05 for fs in provider.started for ps, pe in processing)
+
+
+def test_daily_predict_main_async_runs_inside_event_loop(tmp_path, monkeypatch):
+    daily_predict = pytest.importorskip("daily_predict")
+    cfg = dict(daily_predict.CONFIG, tickers=["AAA"], fetch={"rate_per_sec": 0})
+    monkeypatch.setattr(daily_predict, "CONFIG", cfg)
+    monkeypatch.setattr(daily_predict, "LOGS_DIR", str(tmp_path))
+    monkeypatch.setattr(daily_predict, "build_provider", lambda c: FakeProvider())
+    monkeypatch.setattr(daily_predict, "process_ticker", lambda t, px, d, f, n: (
+        {"Date": d.isoformat(), "Ticker": t}, {"Date": d.isoformat(), "Ticker": t}))
+
+    async def caller():
+        # Same situation as a notebook cell: a loop is already running
+        await daily_predict.main_async()
+    asyncio.run(caller())
+    assert list(pd.read_csv(tmp_path / "signals.csv")["Ticker"]) == ["AAA"]